@@ -2,7 +2,13 @@ import logging
 import feedparser
 import asyncio
 import os
+import argparse
 import json
+import html
+import re
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from pathlib import Path
 import pytz
@@ -23,6 +29,17 @@ TOKEN = os.environ.get('BOT_TOKEN')
 MY_CHANNEL_ID = os.environ.get('MY_CHANNEL_ID')
 TRANSLATION_LANG = os.environ.get('TRANSLATION_LANG', 'ru')
 
+# Burst mode: coalesce matches into digest messages when news floods in
+BURST_THRESHOLD = int(os.environ.get('BURST_THRESHOLD', '6'))  # matches in one cycle
+BURST_WINDOW = int(os.environ.get('BURST_WINDOW', '300'))  # sliding window, seconds
+BURST_WINDOW_THRESHOLD = int(os.environ.get('BURST_WINDOW_THRESHOLD', '12'))  # matches per window
+TELEGRAM_MAX_LENGTH = 4096
+MIN_KEYWORD_MATCHES = 2  # different keywords an article must contain
+MAX_ENTRIES_PER_FEED = 15
+BURST_MIN_DIGEST = 2  # fewer matches than this are posted individually
+DIGEST_TITLE_LENGTH = 200
+DIGEST_SUMMARY_LENGTH = 200
+
 # Settings file path
 SETTINGS_FILE = Path('/tmp/bot_settings.json')
 
@@ -47,6 +64,8 @@ DEFAULT_KEYWORDS = [
 
 # Global փոփոխականներ
 sent_articles = set()
+match_history = deque()  # (monotonic time, matches) per cycle, for burst detection
+burst_mode_active = False
 monitoring_active = True
 current_sources = {}
 current_keywords = []
@@ -494,9 +513,203 @@ async def send_digest(query):
         disable_web_page_preview=True
     )
 
+def scan_entries(name, entries, seen, keywords):
+    """Yield not-yet-seen feed entries as articles with their matched keywords"""
+    for entry in entries[:MAX_ENTRIES_PER_FEED]:
+        title = entry.get('title', '')
+        link = entry.get('link', '')
+        summary = entry.get('summary', '') or entry.get('description', '')
+        
+        clean_summary = re.sub('<[^<]+?>', '', summary)
+        
+        text = (title + ' ' + clean_summary).lower()
+        aid = f"{name}::{link}"
+        
+        if aid in seen:
+            continue
+        
+        yield {
+            'name': name,
+            'title': title,
+            'summary': clean_summary,
+            'link': link,
+            'published': entry.get('published', ''),
+            'keywords': [kw for kw in keywords if kw in text],
+            'aid': aid
+        }
+
+def shorten_link(link):
+    """Կարճացնել երկար հղումը՝ ցուցադրման համար"""
+    if len(link) <= 50:
+        return link
+    import urllib.parse
+    parsed = urllib.parse.urlparse(link)
+    domain = parsed.netloc.replace('www.', '')
+    path = parsed.path[:20] if parsed.path else ''
+    return f"https://{domain}{path}..."
+
+def read_more_link(link):
+    """'Read more' link in the translation language"""
+    label = "Читать полностью" if TRANSLATION_LANG == 'ru' else "Կարդալ ամբողջությամբ"
+    return f"<a href='{link}'>{label}</a>"
+
+def digest_header(n):
+    """Burst digest header in the translation language"""
+    label = "Свежие новости" if TRANSLATION_LANG == 'ru' else "Թարմ նորություններ"
+    return f"⚡️ <b>{label}: {n}</b>\n\n"
+
+def build_article_message(a, translate=None):
+    """Translate one article and build its channel post"""
+    translate = translate or translate_text
+    tr_title = translate(a['title'], TRANSLATION_LANG)
+    tr_summary = ""
+    
+    if a['summary'] and len(a['summary']) > 50:
+        summary_text = a['summary']
+        if len(summary_text) > 4500:
+            chunks = []
+            for i in range(0, len(summary_text), 4500):
+                chunk = summary_text[i:i+4500]
+                chunks.append(translate(chunk, TRANSLATION_LANG))
+            tr_summary = ' '.join(chunks)
+        else:
+            tr_summary = translate(summary_text, TRANSLATION_LANG)
+    
+    msg_tr = f"🌍 <b>{a['name']}</b>\n\n"
+    msg_tr += f"<b>{tr_title}</b>\n\n"
+    
+    if tr_summary:
+        msg_tr += f"{tr_summary}\n\n"
+    
+    if a['time_str']:
+        msg_tr += f"📅 {a['time_str']}\n\n"
+    
+    if len(msg_tr) > 3900:
+        msg_tr = msg_tr[:3900] + "...\n\n"
+    
+    msg_tr += f"🔗 {shorten_link(a['link'])}\n"
+    msg_tr += read_more_link(a['link'])
+    return msg_tr
+
+def shorten_text(text, limit):
+    """Cut plain text to at most limit characters on a word boundary"""
+    if len(text) <= limit:
+        return text
+    return text[:limit - 3].rsplit(' ', 1)[0] + '...'
+
+def build_digest_item(a):
+    """Translate one article into a compact digest entry"""
+    summary = a['summary'] if len(a['summary']) > 50 else ""
+    summary = shorten_text(summary, DIGEST_SUMMARY_LENGTH)
+    
+    # Shorten the plain translations: cutting escaped HTML could break the digest
+    tr_title = shorten_text(translate_text(a['title'], TRANSLATION_LANG), DIGEST_TITLE_LENGTH)
+    tr_summary = shorten_text(translate_text(summary, TRANSLATION_LANG), DIGEST_SUMMARY_LENGTH) if summary else ""
+    
+    # Escape here: one bad character would otherwise break the whole digest
+    item = f"<b>[{html.escape(a['name'])}]</b> <b>{html.escape(tr_title)}</b>\n"
+    if tr_summary:
+        item += f"{html.escape(tr_summary)}\n"
+    item += f"🔗 {read_more_link(html.escape(a['link'], quote=True))}"
+    return item
+
+def digest_budget():
+    """Room for numbered items in one digest message"""
+    return TELEGRAM_MAX_LENGTH - len(digest_header(999))
+
+def pack_digest_messages(items):
+    """Pack (aid, text) digest items into messages under Telegram's limit.
+    
+    Returns a list of (message, [aids]) tuples.
+    """
+    budget = digest_budget()
+    
+    messages = []
+    body, aids = "", []
+    for aid, text in items:
+        entry = f"{len(aids) + 1}. {text}\n\n"
+        if aids and len(body) + len(entry) > budget:
+            messages.append((body, aids))
+            body, aids = "", []
+            entry = f"1. {text}\n\n"
+        body += entry
+        aids.append(aid)
+    if aids:
+        messages.append((body, aids))
+    
+    return [(digest_header(len(a)) + b.rstrip(), a) for b, a in messages]
+
+def update_burst_mode(found):
+    """Record this cycle's match count and decide whether to post digests"""
+    global burst_mode_active
+    
+    now = time.monotonic()
+    match_history.append((now, found))
+    while match_history and now - match_history[0][0] > BURST_WINDOW:
+        match_history.popleft()
+    
+    window_total = sum(n for _, n in match_history)
+    burst = found >= BURST_THRESHOLD or window_total >= BURST_WINDOW_THRESHOLD
+    
+    if burst != burst_mode_active:
+        logger.info(f"{'⚡️ Entering' if burst else '✅ Leaving'} burst mode "
+                    f"(cycle: {found}, last {BURST_WINDOW}s: {window_total})")
+        burst_mode_active = burst
+    return burst
+
+def mark_sent(aid):
+    """Remember a posted article"""
+    global sent_articles
+    sent_articles.add(aid)
+    if len(sent_articles) > 300:
+        sent_articles = set(list(sent_articles)[-150:])
+
+async def send_digests(context: ContextTypes.DEFAULT_TYPE, new):
+    """Burst mode: send matches as a few packed digest messages"""
+    # Most relevant first: keyword-match count, then recency
+    new = sorted(
+        new,
+        key=lambda x: (len(x['keywords']), x['datetime'] or datetime.min.replace(tzinfo=pytz.UTC)),
+        reverse=True
+    )
+    
+    logger.info(f"Translating {len(new)} articles for digest...")
+    texts = await asyncio.gather(*(asyncio.to_thread(build_digest_item, a) for a in new))
+    
+    items = []
+    for a, text in zip(new, texts):
+        # "NN. " prefix and blank line; an item that can never fit would be retried forever
+        if len(text) + 6 > digest_budget():
+            logger.warning(f"Skipping oversized digest item: {a['title'][:40]}...")
+            mark_sent(a['aid'])
+            continue
+        items.append((a['aid'], text))
+    
+    sent = 0
+    for msg, aids in pack_digest_messages(items):
+        try:
+            await context.bot.send_message(
+                chat_id=MY_CHANNEL_ID,
+                text=msg,
+                parse_mode='HTML',
+                disable_web_page_preview=True
+            )
+            logger.info(f"Digest sent OK ({len(aids)} articles)")
+            
+            for aid in aids:
+                mark_sent(aid)
+            sent += len(aids)
+            
+            await asyncio.sleep(3)
+            
+        except Exception as e:
+            logger.error(f"Digest send error: {e}")
+    
+    return sent
+
 async def check_news_job(context: ContextTypes.DEFAULT_TYPE):
     """Check news and send"""
-    global sent_articles, monitoring_active
+    global monitoring_active
     
     if not MY_CHANNEL_ID or not monitoring_active:
         logger.warning("Skipping: MY_CHANNEL_ID or monitoring disabled")
@@ -513,39 +726,13 @@ async def check_news_job(context: ContextTypes.DEFAULT_TYPE):
             logger.info(f"   Found {len(feed.entries)} entries")
             
             found_matches = 0
-            for entry in feed.entries[:15]:
-                title = entry.get('title', '')
-                link = entry.get('link', '')
-                published = entry.get('published', '')
-                summary = entry.get('summary', '') or entry.get('description', '')
-                
-                import re
-                clean_summary = re.sub('<[^<]+?>', '', summary)
-                
-                text = (title + ' ' + clean_summary).lower()
-                aid = f"{name}::{link}"
-                
-                if aid in sent_articles:
-                    continue
-                
-                # Check keywords - require at least 2 different keywords
-                matched_keywords = [kw for kw in current_keywords if kw in text]
-                
+            for a in scan_entries(name, feed.entries, sent_articles, current_keywords):
                 # Must have at least 2 different keywords
-                if len(matched_keywords) >= 2:
+                if len(a['keywords']) >= MIN_KEYWORD_MATCHES:
                     found_matches += 1
-                    logger.info(f"   ✅ Match found: {title[:50]}... (keywords: {matched_keywords})")
-                    time_str, dt = format_time_with_timezones(published) if published else ("", None)
-                    
-                    new.append({
-                        'name': name,
-                        'title': title,
-                        'summary': clean_summary,
-                        'link': link,
-                        'time_str': time_str,
-                        'datetime': dt,
-                        'aid': aid
-                    })
+                    logger.info(f"   ✅ Match found: {a['title'][:50]}... (keywords: {a['keywords']})")
+                    a['time_str'], a['datetime'] = format_time_with_timezones(a['published']) if a['published'] else ("", None)
+                    new.append(a)
             
             logger.info(f"   {found_matches} new matches from {name}")
                     
@@ -556,50 +743,23 @@ async def check_news_job(context: ContextTypes.DEFAULT_TYPE):
     
     logger.info(f"📊 Total new articles found: {len(new)}")
     
+    burst = update_burst_mode(len(new))
+    
     if not new:
         logger.info("ℹ️ No new articles matching keywords")
         return
     
+    # A lone match after a spike still reads better as a normal post
+    if burst and len(new) >= BURST_MIN_DIGEST:
+        sent = await send_digests(context, new)
+        logger.info(f"✅ Sent {sent} in digests")
+        return
+    
     for a in new:
         try:
             logger.info(f"Translating: {a['title'][:40]}...")
             
-            tr_title = translate_text(a['title'], TRANSLATION_LANG)
-            tr_summary = ""
-            
-            if a['summary'] and len(a['summary']) > 50:
-                summary_text = a['summary']
-                if len(summary_text) > 4500:
-                    chunks = []
-                    for i in range(0, len(summary_text), 4500):
-                        chunk = summary_text[i:i+4500]
-                        chunks.append(translate_text(chunk, TRANSLATION_LANG))
-                    tr_summary = ' '.join(chunks)
-                else:
-                    tr_summary = translate_text(summary_text, TRANSLATION_LANG)
-            
-            short_link = a['link']
-            if len(short_link) > 50:
-                import urllib.parse
-                parsed = urllib.parse.urlparse(short_link)
-                domain = parsed.netloc.replace('www.', '')
-                path = parsed.path[:20] if parsed.path else ''
-                short_link = f"https://{domain}{path}..."
-            
-            msg_tr = f"🌍 <b>{a['name']}</b>\n\n"
-            msg_tr += f"<b>{tr_title}</b>\n\n"
-            
-            if tr_summary:
-                msg_tr += f"{tr_summary}\n\n"
-            
-            if a['time_str']:
-                msg_tr += f"📅 {a['time_str']}\n\n"
-            
-            if len(msg_tr) > 3900:
-                msg_tr = msg_tr[:3900] + "...\n\n"
-            
-            msg_tr += f"🔗 {short_link}\n"
-            msg_tr += f"<a href='{a['link']}'>Читать полностью</a>" if TRANSLATION_LANG == 'ru' else f"<a href='{a['link']}'>Կարդալ ամբողջությամբ</a>"
+            msg_tr = build_article_message(a)
             
             await context.bot.send_message(
                 chat_id=MY_CHANNEL_ID,
@@ -610,10 +770,7 @@ async def check_news_job(context: ContextTypes.DEFAULT_TYPE):
             
             logger.info("Sent OK")
             
-            sent_articles.add(a['aid'])
-            
-            if len(sent_articles) > 300:
-                sent_articles = set(list(sent_articles)[-150:])
+            mark_sent(a['aid'])
             
             await asyncio.sleep(3)
             
@@ -654,8 +811,180 @@ async def post_init(application: Application):
     logger.info("✅ STARTED WITH SAVED SETTINGS")
     logger.info("=" * 50)
 
+REPLAY_EXTENSIONS = ('.xml', '.rss', '.atom')
+
+def stub_translate(text: str, target_lang: str = None) -> str:
+    """Offline stand-in for translate_text"""
+    return f"[{target_lang or TRANSLATION_LANG}] {text}"
+
+def load_replay_items(path):
+    """Yield (source, feed) pairs from a directory of feed files or a .jsonl capture.
+    
+    In a directory, files belong to the source named by their top-level
+    sub-directory (captures/BBC/2026-10-01/0930.xml is BBC); files directly
+    in the directory use their file name.
+    A single feed file is one feed named after the file. Anything else is read
+    as a capture: one {"source": ..., "content": "<raw feed>"} object per line.
+    Raises ValueError for a missing path or a bad capture line.
+    """
+    path = Path(path)
+    if not path.exists():
+        raise ValueError(f"Replay path not found: {path}")
+    
+    if path.is_dir():
+        for f in sorted(path.rglob('*')):
+            if f.is_file() and f.suffix.lower() in REPLAY_EXTENSIONS:
+                parts = f.relative_to(path).parts
+                source = parts[0] if len(parts) > 1 else f.stem
+                yield source, str(f)
+    elif path.suffix.lower() in REPLAY_EXTENSIONS:
+        yield path.stem, str(path)
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            for lineno, line in enumerate(f, 1):
+                if line.strip():
+                    try:
+                        record = json.loads(line)
+                        yield record['source'], record['content']
+                    except (ValueError, KeyError, TypeError) as e:
+                        raise ValueError(f"{path}:{lineno}: bad capture line ({e!r})")
+
+def bounded_map(pool, fn, items, window):
+    """Like pool.map, but keeps at most window items in flight so input is streamed"""
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def parse_replay_item(item):
+    """Parse one archived feed into plain entry dicts (runs in a worker process)"""
+    source, data = item
+    feed = feedparser.parse(data)
+    fields = ('title', 'link', 'published', 'summary', 'description')
+    return source, [{k: entry.get(k, '') for k in fields} for entry in feed.entries]
+
+def load_replay_keywords():
+    """Keywords from the saved settings, without creating the settings file"""
+    try:
+        if SETTINGS_FILE.exists():
+            with open(SETTINGS_FILE, 'r', encoding='utf-8') as f:
+                return json.load(f).get('keywords', DEFAULT_KEYWORDS.copy())
+    except Exception as e:
+        logger.error(f"Error loading settings: {e}")
+    return DEFAULT_KEYWORDS.copy()
+
+def replay(path, keywords, min_keywords=MIN_KEYWORD_MATCHES, workers=None,
+           labels=None, translate=False, verbose=False):
+    """Stream archived feeds through scan_entries and print match statistics"""
+    started = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    
+    seen = set()
+    scanned = []  # (article, keyword count) for every distinct entry
+    matches = []
+    feeds = entries = 0
+    
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        parsed = bounded_map(pool, parse_replay_item, load_replay_items(path), workers * 4)
+        for source, feed_entries in parsed:
+            feeds += 1
+            entries += len(feed_entries)
+            # Every scanned entry counts as seen, so repeated captures of a feed are deduped
+            for a in scan_entries(source, feed_entries, seen, keywords):
+                seen.add(a['aid'])
+                scanned.append((a, len(a['keywords'])))
+                if len(a['keywords']) >= min_keywords:
+                    matches.append(a)
+    
+    messages = []
+    if translate:
+        for a in matches:
+            a['time_str'], a['datetime'] = format_time_with_timezones(a['published']) if a['published'] else ("", None)
+            messages.append(build_article_message(a, translate=stub_translate))
+    
+    elapsed = time.perf_counter() - started
+    
+    print(f"Feeds: {feeds}  entries: {entries}  distinct scanned: {len(scanned)}  "
+          f"({elapsed:.2f}s, {workers} workers)")
+    print(f"Matches (>= {min_keywords} keywords): {len(matches)}")
+    
+    if messages:
+        avg = sum(len(m) for m in messages) / len(messages)
+        print(f"Messages built: {len(messages)}  avg length: {avg:.0f}")
+    
+    print("\nPer source:")
+    for source, n in Counter(a['name'] for a in matches).most_common():
+        print(f"  {source:<20} {n}")
+    
+    print("\nKeyword hits in matches:")
+    for kw, n in Counter(kw for a in matches for kw in a['keywords']).most_common():
+        print(f"  {kw:<20} {n}")
+    
+    relevant = None
+    if labels:
+        with open(labels, 'r', encoding='utf-8') as f:
+            relevant = {line.strip() for line in f if line.strip() and not line.startswith('#')}
+        # Recall is against all labels; unseen ones are usually cut by MAX_ENTRIES_PER_FEED
+        unseen = relevant - {a['link'] for a, _ in scanned}
+        print(f"\nLabels: {len(relevant)}  never scanned: {len(unseen)}")
+        if verbose:
+            for link in sorted(unseen):
+                print(f"  {link}")
+    
+    # How the filter would behave at other thresholds
+    print("\nThreshold  matches" + ("  precision  recall" if relevant is not None else ""))
+    for k in range(1, max(5, min_keywords + 2)):
+        selected = [a for a, n in scanned if n >= k]
+        row = f"  {'*' if k == min_keywords else ' '}{k:<8} {len(selected):>7}"
+        if relevant is not None:
+            hits = sum(1 for a in selected if a['link'] in relevant)
+            found = {a['link'] for a in selected} & relevant
+            precision = hits / len(selected) if selected else 0.0
+            recall = len(found) / len(relevant) if relevant else 0.0
+            row += f"  {precision:>9.1%}  {recall:>6.1%}"
+        print(row)
+    
+    if verbose:
+        print("\nMatched:")
+        for a in matches:
+            print(f"  [{a['name']}] {a['title'][:80]} ({', '.join(a['keywords'])})")
+
+def parse_args(argv=None):
+    """Command-line options"""
+    parser = argparse.ArgumentParser(description="Artak News Monitor")
+    parser.add_argument('--replay', metavar='PATH',
+                        help="replay a saved RSS/Atom file, a directory of them or a .jsonl capture instead of running the bot")
+    parser.add_argument('--keywords', help="comma-separated keywords (default: saved settings)")
+    parser.add_argument('--min-keywords', type=int, default=MIN_KEYWORD_MATCHES,
+                        help=f"different keywords required for a match (default: {MIN_KEYWORD_MATCHES})")
+    parser.add_argument('--workers', type=int, help="parser processes (default: CPU count)")
+    parser.add_argument('--labels', metavar='FILE', help="file of relevant article links, one per line, for precision/recall")
+    parser.add_argument('--translate', action='store_true', help="build channel posts through a stub translator")
+    parser.add_argument('-v', '--verbose', action='store_true', help="list matched articles")
+    args = parser.parse_args(argv)
+    if args.workers is not None and args.workers < 1:
+        parser.error("--workers must be at least 1")
+    return args
+
 def main():
     """Main"""
+    args = parse_args()
+    
+    if args.replay:
+        if args.keywords:
+            keywords = [kw.strip().lower() for kw in args.keywords.split(',') if kw.strip()]
+        else:
+            keywords = load_replay_keywords()
+        try:
+            replay(args.replay, keywords, args.min_keywords, args.workers,
+                   args.labels, args.translate, args.verbose)
+        except (ValueError, OSError) as e:
+            raise SystemExit(f"❌ {e}")
+        return
+    
     if not TOKEN:
         logger.error("❌ BOT_TOKEN not set!")
         return